@@ -30,6 +30,20 @@ def compute_principal_axis_matrix(array_coords: np.ndarray) -> np.ndarray:
     return eigen_vectors
 
 
+def get_principal_axis_lengths(array_coords: np.ndarray) -> list[float]:
+    """
+    Compute the extent of the coordinates along each of their principal axes, longest first.
+    """
+    coords = array_coords.astype(np.float64)
+    coords -= np.mean(coords, axis=0)
+
+    # the inertia matrix is symmetric, so eigh gives stable orthonormal eigen vectors as columns
+    inertia = np.dot(coords.transpose(), coords)
+    _, eigen_vectors = np.linalg.eigh(inertia)
+
+    return sorted(np.ptp(np.dot(coords, eigen_vectors), axis=0).tolist(), reverse=True)
+
+
 def df_to_numpy_coords(coords: pd.DataFrame) -> np.ndarray:
     """
     Convert the coordinates from a pandas dataframe to a numpy array
@@ -82,6 +82,7 @@ ATOMIC_RADII = {
 VOXEL_SIZE = 3.0
 OCCLUDED_DIMENSION_LIMIT = 4
 MIN_NUM_VOXELS = 4
+OCCLUSION_SLAB_SIZE = 64
 
 VOXEL_TYPE_CHAIN_MAP = {"HUB": "A", "POR": "B", "POK": "C", "CAV": "D", "OCC": "E"}
 VOXEL_TYPE_ATOM_MAP = {"HUB": "F", "POR": "O", "POK": "N", "CAV": "S", "OCC": "H"}
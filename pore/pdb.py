@@ -13,7 +13,6 @@ from Bio.PDB import PDBParser, Select, Structure, DSSP
 from Bio.PDB.PDBExceptions import PDBConstructionWarning
 from Bio.PDB.PDBIO import PDBIO
 from Bio import pairwise2
-from pyntcloud.structures.voxelgrid import VoxelGrid
 import pandas as pd
 import numpy as np
 
@@ -26,7 +25,7 @@ from pore.constants import (
     STRIDE_CODES,
 )
 from pore.paths import PREPARED_PDB_DIR, ANNOTATED_PDB_DIR
-from pore.types import VoxelGroup, Annotation
+from pore.types import VoxelGroup, VoxelGrid, Annotation
 from pore import utils
 
 
@@ -136,18 +135,20 @@ def make_atom_line(
 def make_atom_lines(
     voxel_type: str,
     resnum: int,
-    voxel_indices: set[int],
-    surface_indices: set[int],
-    voxel_grid_centers: np.ndarray,
+    voxel_indices: np.ndarray,
+    surface_indices: np.ndarray,
+    voxel_grid: VoxelGrid,
 ) -> list[str]:
     """
     Make all atom lines for a given set of voxel indices
     """
+    is_surface = np.isin(voxel_indices, surface_indices)
+    voxel_centers = utils.get_voxel_centers(voxel_indices, voxel_grid)
     return [
-        make_atom_line(voxel_type, resnum, voxel_index, voxel_grid_centers[voxel_index], 50.0)
-        if voxel_index in surface_indices
-        else make_atom_line(voxel_type, resnum, voxel_index, voxel_grid_centers[voxel_index], 0.0)
-        for voxel_index in voxel_indices
+        make_atom_line(voxel_type, resnum, voxel_index, voxel_center, 50.0)
+        if surface
+        else make_atom_line(voxel_type, resnum, voxel_index, voxel_center, 0.0)
+        for voxel_index, voxel_center, surface in zip(voxel_indices, voxel_centers, is_surface)
     ]
 
 
@@ -165,23 +166,23 @@ def points_to_pdb(
     return list(
         itertools.chain(
             *[
-                make_atom_lines("HUB", i, voxel_group.indices, voxel_group.surface_indices, voxel_grid.voxel_centers)
+                make_atom_lines("HUB", i, voxel_group.indices, voxel_group.surface_indices, voxel_grid)
                 for i, voxel_group in hubs.items()
             ],
             *[
-                make_atom_lines("POR", i, voxel_group.indices, voxel_group.surface_indices, voxel_grid.voxel_centers)
+                make_atom_lines("POR", i, voxel_group.indices, voxel_group.surface_indices, voxel_grid)
                 for i, voxel_group in pores.items()
             ],
             *[
-                make_atom_lines("POK", i, voxel_group.indices, voxel_group.surface_indices, voxel_grid.voxel_centers)
+                make_atom_lines("POK", i, voxel_group.indices, voxel_group.surface_indices, voxel_grid)
                 for i, voxel_group in pockets.items()
             ],
             *[
-                make_atom_lines("CAV", i, voxel_group.indices, voxel_group.surface_indices, voxel_grid.voxel_centers)
+                make_atom_lines("CAV", i, voxel_group.indices, voxel_group.surface_indices, voxel_grid)
                 for i, voxel_group in cavities.items()
             ],
             *[
-                make_atom_lines("OCC", i, voxel_group.indices, voxel_group.surface_indices, voxel_grid.voxel_centers)
+                make_atom_lines("OCC", i, voxel_group.indices, voxel_group.surface_indices, voxel_grid)
                 for i, voxel_group in occluded.items()
             ],
         )
@@ -14,17 +14,20 @@ from pore.paths import PREPARED_PDB_DIR
 
 
 def annotate_pdb_structure(
-    structure: Structure.Structure, min_voxels: Optional[int] = 2, min_volume: Optional[float] = None
+    structure: Structure.Structure,
+    min_voxels: Optional[int] = 2,
+    min_volume: Optional[float] = None,
+    jobs: int = 1,
 ) -> tuple[Annotation, list[str]]:
     """
     Perform analysis of a prepared structure.
+
+    `jobs` sets the number of threads used to classify the buried voxel groups.
     """
     coords = pdb.get_structure_coords(structure)
     coords = fib_sphere.add_extra_points(coords, utils.VOXEL_SIZE)
 
-    cloud = voxel.coords_to_point_cloud(coords)
-    cloud, voxel_grid_id = voxel.add_voxel_grid(cloud)
-    voxel_grid = voxel.get_voxel_grid(cloud, voxel_grid_id)
+    voxel_grid = voxel.voxelize_coords(coords, utils.VOXEL_SIZE)
 
     protein_solvent_voxels = voxel.get_protein_solvent_voxel_array(voxel_grid)
     protein_voxels, solvent_voxels = voxel.get_protein_and_solvent_voxels(protein_solvent_voxels, voxel_grid.x_y_z)
@@ -33,12 +36,16 @@ def annotate_pdb_structure(
         solvent_voxels, protein_voxels, voxel_grid.x_y_z
     )
 
-    # get sub-selection of exposed voxels that are NEXT to a buried voxel
-    first_shell_exposed_voxels = voxel.get_first_shell_exposed_voxels(exposed_voxels, buried_voxels, voxel_grid)
+    # without buried voxels there is nothing to agglomerate, so every volume type is empty
+    if buried_voxels.num_voxels == 0:
+        hubs, pores, pockets, cavities, occluded = {}, {}, {}, {}, {}
+    else:
+        # get sub-selection of exposed voxels that are NEXT to a buried voxel
+        first_shell_exposed_voxels = voxel.get_first_shell_exposed_voxels(exposed_voxels, buried_voxels, voxel_grid)
 
-    hubs, pores, pockets, cavities, occluded = voxel.get_pores_pockets_cavities_occluded(
-        buried_voxels, first_shell_exposed_voxels, voxel_grid
-    )
+        hubs, pores, pockets, cavities, occluded = voxel.get_pores_pockets_cavities_occluded(
+            buried_voxels, first_shell_exposed_voxels, voxel_grid, jobs=jobs
+        )
     hubs = utils.sort_voxelgroups_by_volume(
         utils.filter_voxelgroups_by_volume(hubs, min_voxels=min_voxels, min_volume=min_volume)
     )
@@ -55,6 +62,11 @@ def annotate_pdb_structure(
         utils.filter_voxelgroups_by_volume(occluded, min_voxels=min_voxels, min_volume=min_volume)
     )
 
+    hub_volumes, hub_dimensions = utils.get_volumes_and_dimensions(hubs)
+    pore_volumes, pore_dimensions = utils.get_volumes_and_dimensions(pores)
+    cavity_volumes, cavity_dimensions = utils.get_volumes_and_dimensions(cavities)
+    pocket_volumes, pocket_dimensions = utils.get_volumes_and_dimensions(pockets)
+
     annotation = Annotation(
         total_hub_volume=utils.get_volume_summary(hubs, "total"),
         total_pore_volume=utils.get_volume_summary(pores, "total"),
@@ -68,14 +80,14 @@ def annotate_pdb_structure(
         num_pores=len(pores),
         num_cavities=len(cavities),
         num_pockets=len(pockets),
-        hub_volumes={i: hub.volume for i, hub in hubs.items()},
-        pore_volumes={i: pore.volume for i, pore in pores.items()},
-        cavity_volumes={i: cavity.volume for i, cavity in cavities.items()},
-        pocket_volumes={i: pocket.volume for i, pocket in pockets.items()},
-        hub_dimensions={i: hub.axial_lengths for i, hub in hubs.items()},
-        pore_dimensions={i: pore.axial_lengths for i, pore in pores.items()},
-        cavity_dimensions={i: cavity.axial_lengths for i, cavity in cavities.items()},
-        pocket_dimensions={i: pocket.axial_lengths for i, pocket in pockets.items()},
+        hub_volumes=hub_volumes,
+        pore_volumes=pore_volumes,
+        cavity_volumes=cavity_volumes,
+        pocket_volumes=pocket_volumes,
+        hub_dimensions=hub_dimensions,
+        pore_dimensions=pore_dimensions,
+        cavity_dimensions=cavity_dimensions,
+        pocket_dimensions=pocket_dimensions,
     )
 
     pdb_lines = pdb.points_to_pdb(voxel_grid, hubs, pores, pockets, cavities, occluded)
@@ -130,11 +142,13 @@ def download_pdb_file(pdb_id: str) -> Path:
     return utils.get_downloaded_pdb_path(pdb_id)
 
 
-def process_pdb_file(pdb_file: Path) -> tuple[Annotation, list[str]]:
+def process_pdb_file(pdb_file: Path, jobs: int = 1) -> tuple[Annotation, list[str]]:
     """
     Perform end-to-end pipeline on a single PDB file.
+
+    `jobs` sets the number of threads used to classify the buried voxel groups.
     """
     prepared_structure, remarks = prepare_pdb_file(pdb_file)
     pdb.save_pdb(prepared_structure, PREPARED_PDB_DIR / pdb_file.name, remarks=remarks)
 
-    return annotate_pdb_structure(prepared_structure)
+    return annotate_pdb_structure(prepared_structure, jobs=jobs)
@@ -0,0 +1,28 @@
+import pytest
+
+from pore import pdb, pore, paths
+
+
+@pytest.mark.parametrize("structure_name", ["cavity", "pocket", "pore", "hub"])
+def test_annotate_pdb_structure_jobs(structure_name):
+    structure_path = paths.DATA_DIR / "test_data" / f"{structure_name}.pdb"
+    serial_annotation, serial_lines = pore.annotate_pdb_structure(pdb.load_pdb(structure_path), jobs=1)
+    threaded_annotation, threaded_lines = pore.annotate_pdb_structure(pdb.load_pdb(structure_path), jobs=2)
+
+    assert threaded_annotation == serial_annotation
+    assert threaded_lines == serial_lines
+
+
+@pytest.mark.parametrize(
+    "structure_name, pocket_dimensions",
+    [
+        ("pocket", [10.931, 8.325, 6.912]),
+        ("pore", [17.744, 9.967, 9.747]),
+        ("hub", [17.742, 10.063, 9.852]),
+    ],
+)
+def test_annotate_pdb_structure_pocket_dimensions(structure_name, pocket_dimensions):
+    structure_path = paths.DATA_DIR / "test_data" / f"{structure_name}.pdb"
+    annotation, _ = pore.annotate_pdb_structure(pdb.load_pdb(structure_path))
+
+    assert annotation.pocket_dimensions[0] == pytest.approx(pocket_dimensions, abs=1e-3)
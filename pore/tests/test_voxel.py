@@ -2,14 +2,31 @@ import pytest
 import numpy as np
 import ctypes
 
+import pandas as pd
+from scipy import ndimage
+
 from pore.voxel import (
-    get_single_voxel,
-    is_neighbor_voxel,
+    voxelize_coords,
+    compute_voxel_indices,
+    unravel_voxel_indices,
     breadth_first_search_python,
     breadth_first_search_c,
-    get_neighbor_voxels_python,
-    get_neighbor_voxels_c,
+    get_neighbor_voxels,
+    get_planar_extrema,
+    get_occlusion_codes,
+    BURIED_LOOKUP,
+    get_connected_components,
+    get_agglomerated_type,
+    get_exposed_neighbor_mask,
+    dilate_ordinal,
+    ORDINAL_STRUCTURE,
+    classify_buried_voxels_python,
+    classify_buried_voxels_c,
+    classify_buried_voxels,
+    get_boundary_axis_counts,
+    get_voxel_group_axial_lengths,
 )
+from pore.utils import get_voxel_centers
 from pore.paths import C_CODE_DIR
 
 
@@ -18,216 +35,346 @@ VOXEL_C = ctypes.CDLL(str(VOXEL_C_PATH.absolute()))
 
 
 @pytest.mark.parametrize(
-    "voxels, index, voxel",
+    "coords, voxel_size, x_y_z, voxel_n",
     [
         (
-            (np.array([0, 9, 12]), np.array([1, 2, 7]), np.array([21, 0, 0])),
-            0,
-            (0, 1, 21),
+            pd.DataFrame({"x": [0.0, 1.0], "y": [0.0, 1.0], "z": [0.0, 1.0]}),
+            1.0,
+            np.array([2, 2, 2]),
+            np.array([0, 7]),
         ),
         (
-            (np.array([0, 9, 12]), np.array([1, 2, 7]), np.array([21, 0, 0])),
-            1,
-            (9, 2, 0),
+            pd.DataFrame({"x": [0.0, 1.0, 2.5], "y": [0.0, 0.0, 0.0], "z": [0.0, 0.0, 0.0]}),
+            1.0,
+            np.array([3, 1, 1]),
+            np.array([0, 1, 2]),
         ),
     ],
 )
-def test_get_single_voxel(voxels, index, voxel):
-    assert get_single_voxel(voxels, index) == voxel
+def test_voxelize_coords(coords, voxel_size, x_y_z, voxel_n):
+    voxel_grid = voxelize_coords(coords, voxel_size)
+    assert np.array_equal(voxel_grid.x_y_z, x_y_z)
+    assert np.array_equal(voxel_grid.voxel_n, voxel_n)
 
 
 @pytest.mark.parametrize(
-    "voxels, index, voxel",
+    "coords, voxel_size, voxel_centers",
     [
         (
-            (np.array([0, 9, 12]), np.array([1, 2, 7]), np.array([21, 0, 0])),
-            0,
-            [0, 1, 21],
-        ),
-        (
-            (np.array([0, 9, 12]), np.array([1, 2, 7]), np.array([21, 0, 0])),
-            1,
-            [9, 2, 0],
+            pd.DataFrame({"x": [0.0, 1.0], "y": [0.0, 1.0], "z": [0.0, 1.0]}),
+            1.0,
+            np.array([[0.0, 0.0, 0.0], [1.0, 1.0, 1.0]]),
         ),
     ],
 )
-def test_get_single_voxel_c(voxels, index, voxel):
-    num_voxels = len(voxels[0])
-    voxels_x = (ctypes.c_int * num_voxels)(*voxels[0])
-    voxels_y = (ctypes.c_int * num_voxels)(*voxels[1])
-    voxels_z = (ctypes.c_int * num_voxels)(*voxels[2])
+def test_get_voxel_centers(coords, voxel_size, voxel_centers):
+    voxel_grid = voxelize_coords(coords, voxel_size)
+    assert np.allclose(get_voxel_centers(voxel_grid.voxel_n, voxel_grid), voxel_centers)
 
-    initial_single_voxel_indices = (ctypes.c_int * 3)(*([-1] * 3))
 
-    VOXEL_C.get_single_voxel.restype = ctypes.POINTER(ctypes.c_int * 3)
-    voxel_indices_c = VOXEL_C.get_single_voxel(
-        ctypes.byref(voxels_x),
-        ctypes.byref(voxels_y),
-        ctypes.byref(voxels_z),
-        index,
-        ctypes.byref(initial_single_voxel_indices),
+@pytest.mark.parametrize(
+    "coords, voxel_size, axial_lengths",
+    [
+        (
+            pd.DataFrame(
+                {"x": [x for x in range(5) for _ in range(2)], "y": [0.0, 1.0] * 5, "z": [0.0] * 10}, dtype=float
+            ),
+            1.0,
+            [4.0, 1.0, 0.0],
+        ),
+        (
+            pd.DataFrame({"x": [0.0, 1.0, 2.0, 3.0], "y": [0.0, 1.0, 2.0, 3.0], "z": [0.0, 0.0, 0.0, 0.0]}),
+            1.0,
+            [np.sqrt(18), 0.0, 0.0],
+        ),
+    ],
+)
+def test_get_voxel_group_axial_lengths(coords, voxel_size, axial_lengths):
+    voxel_grid = voxelize_coords(coords, voxel_size)
+    voxel_indices = np.unique(voxel_grid.voxel_n)
+    assert np.allclose(get_voxel_group_axial_lengths(voxel_indices, voxel_grid), axial_lengths)
+    # the lengths do not depend on the order the voxels are given in
+    assert get_voxel_group_axial_lengths(voxel_indices[::-1], voxel_grid) == get_voxel_group_axial_lengths(
+        voxel_indices, voxel_grid
     )
 
-    assert [i for i in voxel_indices_c.contents] == voxel
-
 
 @pytest.mark.parametrize(
-    "voxel_one, voxel_two, is_neighbor",
+    "voxels, grid_dimensions, voxel_indices",
     [
         (
-            (1, 7, 9),
-            (2, 7, 9),
-            True,
+            np.array([[0, 0, 0], [0, 0, 1], [0, 1, 0], [1, 0, 0], [2, 3, 4]], dtype=np.int32),
+            np.array([3, 4, 5]),
+            np.array([0, 1, 5, 20, 59]),
+        ),
+        (
+            np.array([[1200, 1300, 1400]], dtype=np.int32),
+            np.array([1500, 1500, 1500]),
+            np.array([1200 * 1500 * 1500 + 1300 * 1500 + 1400]),
         ),
         (
-            (1, 7, 9),
-            (2, 8, 9),
-            False,
+            np.empty((0, 3), dtype=np.int32),
+            np.array([3, 4, 5]),
+            np.array([], dtype=np.int64),
         ),
     ],
 )
-def test_is_neighbor_voxel(voxel_one, voxel_two, is_neighbor):
-    assert is_neighbor_voxel(voxel_one, voxel_two) == is_neighbor
+def test_compute_voxel_indices(voxels, grid_dimensions, voxel_indices):
+    computed_voxel_indices = compute_voxel_indices(voxels, grid_dimensions)
+    assert computed_voxel_indices.dtype == np.int64
+    assert np.array_equal(computed_voxel_indices, voxel_indices)
 
 
 @pytest.mark.parametrize(
-    "voxel_one, voxel_two, is_neighbor",
+    "voxel_indices, grid_dimensions, voxels",
     [
         (
-            (1, 7, 9),
-            (2, 7, 9),
-            True,
+            np.array([0, 1, 5, 20, 59]),
+            np.array([3, 4, 5]),
+            np.array([[0, 0, 0], [0, 0, 1], [0, 1, 0], [1, 0, 0], [2, 3, 4]]),
         ),
         (
-            (1, 7, 9),
-            (2, 8, 9),
-            False,
+            np.array([], dtype=np.int64),
+            np.array([3, 4, 5]),
+            np.empty((0, 3), dtype=np.int32),
         ),
     ],
 )
-def test_is_neighbor_voxel_c(voxel_one, voxel_two, is_neighbor):
-    voxel_one = (ctypes.c_int * 3)(*voxel_one)
-    voxel_two = (ctypes.c_int * 3)(*voxel_two)
-
-    is_neighbor_c = VOXEL_C.is_neighbor_voxel(
-        ctypes.byref(voxel_one),
-        ctypes.byref(voxel_two),
-    )
-
-    assert bool(is_neighbor_c) == is_neighbor
+def test_unravel_voxel_indices(voxel_indices, grid_dimensions, voxels):
+    computed_voxels = unravel_voxel_indices(voxel_indices, grid_dimensions)
+    assert computed_voxels.dtype == np.int32
+    assert np.array_equal(computed_voxels, voxels)
 
 
 @pytest.mark.parametrize(
     "voxels, searchable_indices, neighbor_indices",
     [
         (
-            (
-                np.array([0, 1, 1, 1, 1, 2]),
-                np.array([0, 0, 1, 1, 2, 2]),
-                np.array([0, 0, 0, 1, 0, 2]),
-            ),
-            set([0, 1, 2, 3, 4, 5]),
-            set([0, 1, 2, 3, 4]),
+            np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [1, 1, 1], [1, 2, 0], [2, 2, 2]]),
+            np.array([0, 1, 2, 3, 4, 5]),
+            np.array([0, 1, 2, 3, 4]),
         ),
         (
-            (
-                np.array([0, 1, 1, 1, 1, 2]),
-                np.array([0, 0, 1, 1, 2, 2]),
-                np.array([0, 0, 0, 1, 0, 2]),
-            ),
-            set([0, 1, 4, 5]),
-            set([0, 1]),
+            np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [1, 1, 1], [1, 2, 0], [2, 2, 2]]),
+            np.array([0, 1, 4, 5]),
+            np.array([0, 1]),
         ),
     ],
 )
 def test_breadth_first_search_python(voxels, searchable_indices, neighbor_indices):
-    assert breadth_first_search_python(voxels, searchable_indices) == neighbor_indices
+    assert np.array_equal(breadth_first_search_python(voxels, searchable_indices), neighbor_indices)
 
 
 @pytest.mark.parametrize(
     "voxels, searchable_indices, neighbor_indices",
     [
         (
-            (
-                np.array([0, 1, 1, 1, 1, 2]),
-                np.array([0, 0, 1, 1, 2, 2]),
-                np.array([0, 0, 0, 1, 0, 2]),
-            ),
-            set([0, 1, 2, 3, 4, 5]),
-            set([0, 1, 2, 3, 4]),
+            np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [1, 1, 1], [1, 2, 0], [2, 2, 2]]),
+            np.array([0, 1, 2, 3, 4, 5]),
+            np.array([0, 1, 2, 3, 4]),
         ),
         (
-            (
-                np.array([0, 1, 1, 1, 1, 2]),
-                np.array([0, 0, 1, 1, 2, 2]),
-                np.array([0, 0, 0, 1, 0, 2]),
-            ),
-            set([0, 1, 4, 5]),
-            set([0, 1]),
+            np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [1, 1, 1], [1, 2, 0], [2, 2, 2]]),
+            np.array([0, 1, 4, 5]),
+            np.array([0, 1]),
         ),
     ],
 )
 def test_breadth_first_search_c(voxels, searchable_indices, neighbor_indices):
-    assert breadth_first_search_c(voxels, searchable_indices) == neighbor_indices
+    assert np.array_equal(breadth_first_search_c(voxels, searchable_indices), neighbor_indices)
 
 
 @pytest.mark.parametrize(
     "query_voxels, reference_voxels, neighbor_voxels",
     [
         (
-            (
-                np.array([1, 1, 1, 1, 2]),
-                np.array([0, 1, 1, 2, 2]),
-                np.array([0, 0, 1, 0, 2]),
-            ),
-            (
-                np.array([0, 2]),
-                np.array([0, 2]),
-                np.array([0, 3]),
-            ),
-            (
-                np.array([1, 2]),
-                np.array([0, 2]),
-                np.array([0, 2]),
-            ),
+            np.array([[1, 0, 0], [1, 1, 0], [1, 1, 1], [1, 2, 0], [2, 2, 2]]),
+            np.array([[0, 0, 0], [2, 2, 3]]),
+            np.array([[1, 0, 0], [2, 2, 2]]),
+        ),
+    ],
+)
+def test_get_neighbor_voxels(query_voxels, reference_voxels, neighbor_voxels):
+    computed_neighbor_voxels = get_neighbor_voxels(query_voxels, reference_voxels)
+    assert np.array_equal(computed_neighbor_voxels, neighbor_voxels)
+
+
+@pytest.mark.parametrize(
+    "voxel_grid_dimensions, fraction", [(np.array([40, 30, 20]), 0.05), (np.array([24, 24, 24]), 0.5)]
+)
+def test_get_neighbor_voxels_dilation(voxel_grid_dimensions, fraction):
+    rng = np.random.default_rng(0)
+    is_reference = rng.random(voxel_grid_dimensions) < fraction
+    query_voxels = np.argwhere(~is_reference).astype(np.int32)
+    reference_voxels = np.argwhere(is_reference).astype(np.int32)
+
+    # the neighbors are the query voxels inside the ordinal dilation of the reference voxels
+    is_neighbor = ndimage.binary_dilation(is_reference, structure=ORDINAL_STRUCTURE) & ~is_reference
+    assert np.array_equal(get_neighbor_voxels(query_voxels, reference_voxels), np.argwhere(is_neighbor))
+
+
+@pytest.mark.parametrize(
+    "query_voxels, occluding_voxels, voxel_grid_dimensions, occluded_dimensions",
+    [
+        (
+            np.array([[1, 1, 1], [0, 0, 0]]),
+            np.array([[1, 1, 0], [1, 1, 2], [0, 1, 1], [2, 1, 1]]),
+            np.array([3, 3, 3]),
+            np.array([[1, 1, 0, 0, 1, 1], [0, 0, 0, 0, 0, 0]]),
+        ),
+    ],
+)
+def test_get_occlusion_codes(query_voxels, occluding_voxels, voxel_grid_dimensions, occluded_dimensions):
+    planar_extrema = [get_planar_extrema(occluding_voxels, voxel_grid_dimensions, axis) for axis in range(3)]
+    computed_occlusion_codes = get_occlusion_codes(query_voxels, planar_extrema)
+    assert np.array_equal(computed_occlusion_codes, np.packbits(occluded_dimensions, axis=1, bitorder="little")[:, 0])
+
+
+@pytest.mark.parametrize(
+    "voxels, voxel_grid_dimensions, axis, minimums, maximums",
+    [
+        (
+            np.array([[0, 1, 2], [0, 1, 0], [1, 0, 1], [0, 1, 1]]),
+            np.array([2, 2, 3]),
+            2,
+            np.array([[np.iinfo(np.int32).max, 0], [1, np.iinfo(np.int32).max]]),
+            np.array([[-1, 2], [1, -1]]),
+        ),
+    ],
+)
+def test_get_planar_extrema(voxels, voxel_grid_dimensions, axis, minimums, maximums):
+    computed_minimums, computed_maximums = get_planar_extrema(voxels, voxel_grid_dimensions, axis)
+    assert np.array_equal(computed_minimums, minimums)
+    assert np.array_equal(computed_maximums, maximums)
+
+
+@pytest.mark.parametrize(
+    "occluded_dimensions, buried",
+    [
+        (np.array([[1, 1, 1, 1, 1, 1]]), True),
+        (np.array([[1, 1, 1, 1, 0, 0]]), True),
+        (np.array([[1, 1, 0, 1, 1, 0]]), False),
+        (np.array([[1, 0, 1, 0, 1, 0]]), False),
+    ],
+)
+def test_buried_lookup(occluded_dimensions, buried):
+    assert BURIED_LOOKUP[np.packbits(occluded_dimensions, axis=1, bitorder="little")[0, 0]] == buried
+
+
+@pytest.mark.parametrize(
+    "voxels, voxel_grid_dimensions, components",
+    [
+        (
+            np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [1, 1, 1], [1, 2, 0], [2, 2, 2]]),
+            np.array([3, 3, 3]),
+            [set([0, 1, 2, 3, 4]), set([5])],
+        ),
+    ],
+)
+def test_get_connected_components(voxels, voxel_grid_dimensions, components):
+    computed_components = get_connected_components(voxels, voxel_grid_dimensions)
+    assert [set(component.tolist()) for component in computed_components] == components
+
+
+@pytest.mark.parametrize(
+    "exposed_voxels, surface_indices, agglomerated_type",
+    [
+        (
+            np.empty((0, 3), dtype=int),
+            set(),
+            "cavity",
+        ),
+        (
+            np.array([[0, 1, 1]]),
+            set([0, 1]),
+            "pocket",
+        ),
+        (
+            np.array([[0, 1, 1], [7, 1, 1]]),
+            set([0, 1, 4, 5]),
+            "pore",
         ),
     ],
 )
-def test_get_neighbor_voxels_python(query_voxels, reference_voxels, neighbor_voxels):
-    computed_neighbor_voxels = get_neighbor_voxels_python(query_voxels, reference_voxels)
-    assert (
-        np.allclose(computed_neighbor_voxels[0], neighbor_voxels[0])
-        and np.allclose(computed_neighbor_voxels[0], neighbor_voxels[0])
-        and np.allclose(computed_neighbor_voxels[0], neighbor_voxels[0])
+def test_get_agglomerated_type(exposed_voxels, surface_indices, agglomerated_type):
+    buried_voxels = np.array([[1, 1, 1], [2, 1, 1], [3, 1, 1], [4, 1, 1], [5, 1, 1], [6, 1, 1]])
+    exposed_neighbor_mask = get_exposed_neighbor_mask(exposed_voxels, np.array([8, 3, 3]))
+    computed_surface_indices, computed_agglomerated_type = get_agglomerated_type(
+        np.arange(6), buried_voxels, exposed_neighbor_mask
     )
+    assert set(computed_surface_indices.tolist()) == surface_indices and computed_agglomerated_type == agglomerated_type
 
 
 @pytest.mark.parametrize(
-    "query_voxels, reference_voxels, neighbor_voxels",
+    "query_voxels, occluding_voxels, voxel_grid_dimensions, buried",
     [
         (
-            (
-                np.array([1, 1, 1, 1, 2]),
-                np.array([0, 1, 1, 2, 2]),
-                np.array([0, 0, 1, 0, 2]),
-            ),
-            (
-                np.array([0, 2]),
-                np.array([0, 2]),
-                np.array([0, 3]),
-            ),
-            (
-                np.array([1, 2]),
-                np.array([0, 2]),
-                np.array([0, 2]),
-            ),
+            np.array([[1, 1, 1], [1, 0, 0], [0, 0, 0]]),
+            np.array([[0, 1, 1], [2, 1, 1], [1, 0, 1], [1, 2, 1], [1, 1, 0], [1, 1, 2]]),
+            np.array([3, 3, 3]),
+            np.array([True, False, False]),
+        ),
+    ],
+)
+def test_classify_buried_voxels_python(query_voxels, occluding_voxels, voxel_grid_dimensions, buried):
+    assert np.array_equal(classify_buried_voxels_python(query_voxels, occluding_voxels, voxel_grid_dimensions), buried)
+
+
+@pytest.mark.parametrize(
+    "query_voxels, occluding_voxels, voxel_grid_dimensions, buried",
+    [
+        (
+            np.array([[1, 1, 1], [1, 0, 0], [0, 0, 0]]),
+            np.array([[0, 1, 1], [2, 1, 1], [1, 0, 1], [1, 2, 1], [1, 1, 0], [1, 1, 2]]),
+            np.array([3, 3, 3]),
+            np.array([True, False, False]),
+        ),
+    ],
+)
+def test_classify_buried_voxels_c(query_voxels, occluding_voxels, voxel_grid_dimensions, buried):
+    assert np.array_equal(classify_buried_voxels_c(query_voxels, occluding_voxels, voxel_grid_dimensions), buried)
+
+
+@pytest.mark.parametrize(
+    "voxel_grid_dimensions, fraction",
+    [
+        (np.array([1, 1, 1]), 1.0),
+        (np.array([5, 4, 8]), 0.1),
+        (np.array([7, 3, 17]), 0.3),
+    ],
+)
+def test_dilate_ordinal(voxel_grid_dimensions, fraction):
+    mask = np.random.default_rng(0).random(voxel_grid_dimensions) < fraction
+    assert np.array_equal(dilate_ordinal(mask), ndimage.binary_dilation(mask, structure=ORDINAL_STRUCTURE))
+
+
+@pytest.mark.parametrize(
+    "voxels, voxel_grid_dimensions, boundary_axis_counts",
+    [
+        (
+            np.array([[1, 1, 1], [0, 1, 1], [0, 2, 1], [2, 0, 2], [0, 0, 0]]),
+            np.array([3, 3, 3]),
+            np.array([0, 1, 2, 3, 3]),
+        ),
+    ],
+)
+def test_get_boundary_axis_counts(voxels, voxel_grid_dimensions, boundary_axis_counts):
+    assert np.array_equal(get_boundary_axis_counts(voxels, voxel_grid_dimensions), boundary_axis_counts)
+
+
+@pytest.mark.parametrize("performant", [False, True])
+@pytest.mark.parametrize(
+    "query_voxels, occluding_voxels, voxel_grid_dimensions, buried",
+    [
+        (
+            np.array([[0, 1, 1], [0, 0, 2], [2, 2, 1]]),
+            np.array([[1, 1, 1], [0, 0, 1], [0, 2, 1], [0, 1, 0], [0, 1, 2], [1, 0, 1]]),
+            np.array([3, 3, 3]),
+            np.array([True, False, False]),
         ),
     ],
 )
-def test_get_neighbor_voxels_c(query_voxels, reference_voxels, neighbor_voxels):
-    computed_neighbor_voxels = get_neighbor_voxels_c(query_voxels, reference_voxels)
-    assert (
-        np.allclose(computed_neighbor_voxels[0], neighbor_voxels[0])
-        and np.allclose(computed_neighbor_voxels[0], neighbor_voxels[0])
-        and np.allclose(computed_neighbor_voxels[0], neighbor_voxels[0])
+def test_classify_buried_voxels(query_voxels, occluding_voxels, voxel_grid_dimensions, buried, performant):
+    assert np.array_equal(
+        classify_buried_voxels(query_voxels, occluding_voxels, voxel_grid_dimensions, performant=performant), buried
     )
@@ -13,11 +13,17 @@ class ComponentData(NamedTuple):
     component_type: str
 
 
+class VoxelGrid(NamedTuple):
+    x_y_z: np.ndarray
+    voxel_n: np.ndarray
+    segment_centers: list[np.ndarray]
+
+
 class VoxelGroup(NamedTuple):
-    voxels: tuple[np.ndarray, ...]
-    indices: set[int]
+    voxels: np.ndarray
+    indices: np.ndarray
     num_voxels: int
-    surface_indices: set[int] = set()
+    surface_indices: np.ndarray = np.array([], dtype=np.int64)
     voxel_type: Optional[str] = None
     volume: float = 0.0
     center: Optional[np.ndarray] = None
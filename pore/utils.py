@@ -13,7 +13,7 @@ import pandas as pd
 import json
 
 from pore import rcsb, constants, paths
-from pore.types import Annotation, VoxelGroup
+from pore.types import Annotation, VoxelGroup, VoxelGrid
 from pore.paths import C_CODE_DIR
 
 
@@ -150,6 +150,16 @@ def set_non_protein(non_protein: bool) -> None:
     KEEP_NON_PROTEIN = non_protein
 
 
+def get_voxel_centers(voxel_indices: np.ndarray, voxel_grid: VoxelGrid) -> np.ndarray:
+    """
+    Return the cartesian coordinates of the center of each voxel given by its voxel-grid index.
+    """
+    voxel_coords = np.unravel_index(voxel_indices, voxel_grid.x_y_z)
+    return np.stack([voxel_grid.segment_centers[axis][voxel_coords[axis]] for axis in range(3)], axis=1).astype(
+        np.float32
+    )
+
+
 def get_volume_summary(voxel_group_dict: dict[int, VoxelGroup], summary_type: str = "total") -> float:
     """
     Compute a summary value for the volume
@@ -168,6 +178,21 @@ def get_volume_summary(voxel_group_dict: dict[int, VoxelGroup], summary_type: st
     return 0.0
 
 
+def get_volumes_and_dimensions(
+    voxel_group_dict: dict[int, VoxelGroup]
+) -> tuple[dict[int, Optional[float]], dict[int, list[float]]]:
+    """
+    Collect the volume and axial lengths of each voxel group in a single pass.
+    """
+    volumes = {}
+    dimensions = {}
+    for i, voxel_group in voxel_group_dict.items():
+        volumes[i] = voxel_group.volume
+        dimensions[i] = voxel_group.axial_lengths
+
+    return volumes, dimensions
+
+
 def sort_voxelgroups_by_volume(voxelgroups: dict[int, VoxelGroup]) -> dict[int, VoxelGroup]:
     """
     Take a dictionary with indices as the keys and VoxelGroups as the values.
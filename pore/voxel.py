@@ -3,18 +3,19 @@ Functions to manipulate and analyze voxels.
 """
 
 
-from copy import deepcopy
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import ctypes
 
 import numpy as np
 import pandas as pd
 
-from pyntcloud import PyntCloud
-from pyntcloud.structures.voxelgrid import VoxelGrid
+from scipy import ndimage
 
 from pore import utils, align
-from pore.constants import OCCLUDED_DIMENSION_LIMIT, MIN_NUM_VOXELS
-from pore.types import VoxelGroup
+from pore.constants import OCCLUDED_DIMENSION_LIMIT, MIN_NUM_VOXELS, OCCLUSION_SLAB_SIZE
+from pore.types import VoxelGroup, VoxelGrid
 from pore.paths import C_CODE_DIR
 
 
@@ -22,42 +23,44 @@ if utils.using_performant():
     VOXEL_C_PATH = C_CODE_DIR / "voxel.so"
     VOXEL_C = ctypes.CDLL(str(VOXEL_C_PATH.absolute()))
 
+# connectivity of a voxel to its six ordinal neighbors
+ORDINAL_STRUCTURE = ndimage.generate_binary_structure(3, 1)
 
-def coords_to_point_cloud(coords: pd.DataFrame) -> PyntCloud:
-    """
-    Produce a point-cloud from atomic coordinates.
-    """
-    return PyntCloud(coords)
 
-
-def add_voxel_grid(cloud: PyntCloud) -> tuple[PyntCloud, str]:
+def voxelize_coords(coords: pd.DataFrame, voxel_size: float = utils.VOXEL_SIZE) -> VoxelGrid:
     """
-    Generate a voxel grid surrounding the point-cloud.
+    Bin the coordinates into a grid of cubic voxels with edge-length `voxel_size`.
+
+    Each axis is padded so that its range is covered by whole voxels, with the padding split evenly on both sides.
+    This matches the layout of the pyntcloud voxel grid previously used, so results are unchanged.
     """
-    voxel_grid_id = cloud.add_structure(
-        "voxelgrid",
-        size_x=utils.VOXEL_SIZE,
-        size_y=utils.VOXEL_SIZE,
-        size_z=utils.VOXEL_SIZE,
-        regular_bounding_box=False,
-    )
-    return cloud, voxel_grid_id
+    points = coords[["x", "y", "z"]].to_numpy()
+    points_range = np.ptp(points, axis=0)
 
+    margin = ((points_range // voxel_size) + 1) * voxel_size - points_range
+    grid_min = points.min(axis=0) - margin / 2
+    grid_max = points.max(axis=0) + margin / 2
+    x_y_z = ((grid_max - grid_min) / voxel_size).astype(int)
 
-def get_voxel_grid(cloud: PyntCloud, voxel_grid_id: str) -> VoxelGrid:
-    """
-    Generate an array representing a binary voxel grid where zero represents no protein
-    atoms in that voxel (e.g. solvent) and a non-zero represents a protein atom in that voxel.
-    """
-    return cloud.structures[voxel_grid_id]
+    segments = [np.linspace(grid_min[axis], grid_max[axis], num=x_y_z[axis] + 1) for axis in range(3)]
+    voxel_coords = [np.clip(np.searchsorted(segments[axis], points[:, axis]) - 1, 0, x_y_z[axis]) for axis in range(3)]
+
+    return VoxelGrid(
+        x_y_z=x_y_z,
+        voxel_n=np.ravel_multi_index(voxel_coords, x_y_z),
+        segment_centers=[(segment[1:] + segment[:-1]) / 2 for segment in segments],
+    )
 
 
 def get_protein_solvent_voxel_array(voxel_grid: VoxelGrid) -> np.ndarray:
     """
     Generate a 3D array of x[y[z]] as the voxel coordinate and the value of that array entry
-    being zero for no protein and one when a protein atom is in that voxel.
+    being False for no protein and True when a protein atom is in that voxel.
     """
-    return voxel_grid.get_feature_vector(mode="binary")
+    binary_voxel_array = np.zeros(voxel_grid.x_y_z, dtype=bool)
+    binary_voxel_array.flat[voxel_grid.voxel_n] = True
+
+    return binary_voxel_array
 
 
 def get_protein_and_solvent_voxels(
@@ -68,11 +71,12 @@ def get_protein_and_solvent_voxels(
     From the voxel grid, return the indices of the protein containing voxels,
     and those not containing protein (e.g. solvent).
     """
-    protein_voxels = np.nonzero(binary_voxel_array)
-    solvent_voxels = np.nonzero(binary_voxel_array == 0)
+    flat_voxel_array = binary_voxel_array.ravel()
+    protein_voxel_indices = np.flatnonzero(flat_voxel_array)
+    solvent_voxel_indices = np.flatnonzero(~flat_voxel_array)
 
-    protein_voxel_indices = compute_voxel_indices(protein_voxels, voxel_grid_dimensions)
-    solvent_voxel_indices = compute_voxel_indices(solvent_voxels, voxel_grid_dimensions)
+    protein_voxels = unravel_voxel_indices(protein_voxel_indices, voxel_grid_dimensions)
+    solvent_voxels = unravel_voxel_indices(solvent_voxel_indices, voxel_grid_dimensions)
 
     return (
         VoxelGroup(
@@ -92,34 +96,33 @@ def get_protein_and_solvent_voxels(
     )
 
 
-def get_occluded_dimensions(
-    query_voxel: tuple[int, int, int],
-    possible_occluding_x: list[int],
-    possible_occluding_y: list[int],
-    possible_occluding_z: list[int],
-) -> list[int]:
+def get_planar_extrema(
+    voxels: np.ndarray, voxel_grid_dimensions: np.ndarray, axis: int
+) -> tuple[np.ndarray, np.ndarray]:
     """
-    Determine how many ordinal axes are occluded.
+    Project the voxels along `axis` onto the plane of the other two dimensions.
+    For each position in that plane return the minimum and maximum coordinate along `axis`.
+
+    Empty positions hold sentinel values that can never occlude a voxel.
     """
-    occluded_dimensions = [0, 0, 0, 0, 0, 0]
+    plane_axes = [dimension for dimension in range(3) if dimension != axis]
+    plane_shape = (voxel_grid_dimensions[plane_axes[0]], voxel_grid_dimensions[plane_axes[1]])
+
+    minimums = np.full(plane_shape[0] * plane_shape[1], np.iinfo(np.int32).max, dtype=np.int32)
+    maximums = np.full(plane_shape[0] * plane_shape[1], -1, dtype=np.int32)
 
-    if len(possible_occluding_z) != 0:
-        if min(possible_occluding_z) < query_voxel[2]:
-            occluded_dimensions[4] = 1
-        if max(possible_occluding_z) > query_voxel[2]:
-            occluded_dimensions[5] = 1
-    if len(possible_occluding_y) != 0:
-        if min(possible_occluding_y) < query_voxel[1]:
-            occluded_dimensions[2] = 1
-        if max(possible_occluding_y) > query_voxel[1]:
-            occluded_dimensions[3] = 1
-    if len(possible_occluding_x) != 0:
-        if min(possible_occluding_x) < query_voxel[0]:
-            occluded_dimensions[0] = 1
-        if max(possible_occluding_x) > query_voxel[0]:
-            occluded_dimensions[1] = 1
+    # sort on a combined (plane position, coordinate) key so each plane position forms a run ordered along `axis`,
+    # the first and last entries of each run are then the extrema
+    keys = voxels[:, plane_axes[0]].astype(np.int64) * plane_shape[1] + voxels[:, plane_axes[1]]
+    keys = np.sort(keys * voxel_grid_dimensions[axis] + voxels[:, axis])
+    plane_indices, coordinates = np.divmod(keys, voxel_grid_dimensions[axis])
+    run_starts = np.flatnonzero(np.diff(plane_indices, prepend=-1))
+    run_ends = np.append(run_starts[1:] - 1, len(keys) - 1)[: len(run_starts)]
 
-    return occluded_dimensions
+    minimums[plane_indices[run_starts]] = coordinates[run_starts]
+    maximums[plane_indices[run_ends]] = coordinates[run_ends]
+
+    return minimums.reshape(plane_shape), maximums.reshape(plane_shape)
 
 
 def is_buried(occluded_dimensions: list[int]) -> bool:
@@ -143,23 +146,123 @@ def is_buried(occluded_dimensions: list[int]) -> bool:
     return False
 
 
-def build_planar_voxel_coordinate_arrays(
-    voxels: tuple[np.ndarray, ...], voxel_grid_dimensions: np.ndarray
-) -> tuple[list[list[list[int]]], list[list[list[int]]], list[list[list[int]]]]:
+# burial decision for every combination of occluded dimensions, indexed by `get_occlusion_codes`
+BURIED_LOOKUP = np.array([is_buried([(mask >> bit) & 1 for bit in range(6)]) for mask in range(64)], dtype=bool)
+
+
+def get_occlusion_codes(query_voxels: np.ndarray, planar_extrema: list[tuple[np.ndarray, np.ndarray]]) -> np.ndarray:
     """
-    For each two-dimension pair, construct a list of coordinates in the 3rd dimension that match the first two dimensions.
+    Determine which ordinal directions are occluded for each query voxel, given the planar extrema
+    of the occluding voxels along each axis.
+
+    Returns a uint8 per voxel with the -x, +x, -y, +y, -z, +z directions packed into the low bits.
     """
-    # TODO collapse down the final lists to min() and max() only as two different entries and use that for comparison in the downstream function
-    z_array = [[list() for y in range(voxel_grid_dimensions[1])] for x in range(voxel_grid_dimensions[0])]
-    y_array = [[list() for z in range(voxel_grid_dimensions[2])] for x in range(voxel_grid_dimensions[0])]
-    x_array = [[list() for z in range(voxel_grid_dimensions[2])] for y in range(voxel_grid_dimensions[1])]
+    occlusion_codes = np.zeros(len(query_voxels), dtype=np.uint8)
 
-    for i in range(voxels[0].size):
-        z_array[voxels[0][i]][voxels[1][i]].append(voxels[2][i])
-        y_array[voxels[0][i]][voxels[2][i]].append(voxels[1][i])
-        x_array[voxels[1][i]][voxels[2][i]].append(voxels[0][i])
+    for axis in range(3):
+        minimums, maximums = planar_extrema[axis]
+        plane_axes = [dimension for dimension in range(3) if dimension != axis]
+        plane_positions = (query_voxels[:, plane_axes[0]], query_voxels[:, plane_axes[1]])
 
-    return z_array, y_array, x_array
+        occlusion_codes |= (minimums[plane_positions] < query_voxels[:, axis]).astype(np.uint8) << (2 * axis)
+        occlusion_codes |= (maximums[plane_positions] > query_voxels[:, axis]).astype(np.uint8) << (2 * axis + 1)
+
+    return occlusion_codes
+
+
+def classify_buried_voxels_python(
+    query_voxels: np.ndarray, occluding_voxels: np.ndarray, voxel_grid_dimensions: np.ndarray
+) -> np.ndarray:
+    """
+    Return a boolean array that is True for each query voxel that is buried by the occluding voxels.
+    """
+    planar_extrema = [get_planar_extrema(occluding_voxels, voxel_grid_dimensions, axis) for axis in range(3)]
+    buried = np.zeros(len(query_voxels), dtype=bool)
+
+    # work through slabs of x-planes so the temporaries and the planar extrema touched by each slab stay cache sized
+    slab_order = np.argsort(query_voxels[:, 0], kind="stable")
+    slab_bounds = np.searchsorted(
+        query_voxels[slab_order, 0], np.arange(0, voxel_grid_dimensions[0] + OCCLUSION_SLAB_SIZE, OCCLUSION_SLAB_SIZE)
+    )
+    for slab_start, slab_end in zip(slab_bounds[:-1], slab_bounds[1:]):
+        slab_indices = slab_order[slab_start:slab_end]
+        buried[slab_indices] = BURIED_LOOKUP[get_occlusion_codes(query_voxels[slab_indices], planar_extrema)]
+
+    return buried
+
+
+def set_c_threads(num_threads: int) -> None:
+    """
+    Limit the number of OpenMP threads used by the C voxel library.
+    """
+    if utils.using_performant():
+        VOXEL_C.set_num_threads(num_threads)
+
+
+def classify_buried_voxels_c(
+    query_voxels: np.ndarray, occluding_voxels: np.ndarray, voxel_grid_dimensions: np.ndarray
+) -> np.ndarray:
+    """
+    Return a boolean array that is True for each query voxel that is buried by the occluding voxels.
+    """
+    c_int_pointer = ctypes.POINTER(ctypes.c_int)
+
+    # make the voxels and planar extrema compatible with C
+    query_x, query_y, query_z = (np.ascontiguousarray(dimension, dtype=np.int32) for dimension in query_voxels.T)
+    planar_extrema = [
+        np.ascontiguousarray(extrema)
+        for axis in range(3)
+        for extrema in get_planar_extrema(occluding_voxels, voxel_grid_dimensions, axis)
+    ]
+    buried_lookup = BURIED_LOOKUP.astype(np.uint8)
+    buried = np.zeros(len(query_x), dtype=np.uint8)
+
+    VOXEL_C.classify_buried_voxels.restype = None
+    VOXEL_C.classify_buried_voxels(
+        query_x.ctypes.data_as(c_int_pointer),
+        query_y.ctypes.data_as(c_int_pointer),
+        query_z.ctypes.data_as(c_int_pointer),
+        len(query_x),
+        *[extrema.ctypes.data_as(c_int_pointer) for extrema in planar_extrema],
+        *[int(dimension) for dimension in voxel_grid_dimensions],
+        buried_lookup.ctypes.data_as(ctypes.POINTER(ctypes.c_ubyte)),
+        buried.ctypes.data_as(ctypes.POINTER(ctypes.c_ubyte)),
+    )
+
+    return buried.astype(bool)
+
+
+def classify_buried_voxels(
+    query_voxels: np.ndarray,
+    occluding_voxels: np.ndarray,
+    voxel_grid_dimensions: np.ndarray,
+    performant: bool = utils.using_performant(),
+) -> np.ndarray:
+    """
+    Return a boolean array that is True for each query voxel that is buried by the occluding voxels.
+
+    Voxels on the grid boundary of two or more axes are unoccluded along two different axes,
+    so they are exposed without consulting the occluding voxels.
+    """
+    buried = np.zeros(len(query_voxels), dtype=bool)
+    candidate_indices = np.flatnonzero(get_boundary_axis_counts(query_voxels, voxel_grid_dimensions) < 2)
+    candidate_voxels = query_voxels[candidate_indices]
+
+    if performant:
+        buried[candidate_indices] = classify_buried_voxels_c(candidate_voxels, occluding_voxels, voxel_grid_dimensions)
+    else:
+        buried[candidate_indices] = classify_buried_voxels_python(
+            candidate_voxels, occluding_voxels, voxel_grid_dimensions
+        )
+
+    return buried
+
+
+def get_boundary_axis_counts(voxels: np.ndarray, voxel_grid_dimensions: np.ndarray) -> np.ndarray:
+    """
+    Return the number of axes along which each voxel lies on the first or last plane of the grid.
+    """
+    return ((voxels == 0) | (voxels == np.asarray(voxel_grid_dimensions) - 1)).sum(axis=1)
 
 
 def get_exposed_and_buried_voxels(
@@ -170,43 +273,24 @@ def get_exposed_and_buried_voxels(
     """
     Use simple geometric heuristics to determine if a group of solvent voxels is buried or exposed.
     """
-    buried_voxels = ([], [], [])
-    exposed_voxels = ([], [], [])
+    buried = classify_buried_voxels(solvent_voxels.voxels, protein_voxels.voxels, voxel_grid_dimensions)
 
-    z_array, y_array, x_array = build_planar_voxel_coordinate_arrays(protein_voxels.voxels, voxel_grid_dimensions)
+    buried_voxels = solvent_voxels.voxels[buried]
+    exposed_voxels = solvent_voxels.voxels[~buried]
 
-    for i in range(solvent_voxels.voxels[0].size):
-        query_voxel = (solvent_voxels.voxels[0][i], solvent_voxels.voxels[1][i], solvent_voxels.voxels[2][i])
-
-        occluded_dimensions = get_occluded_dimensions(
-            query_voxel,
-            x_array[query_voxel[1]][query_voxel[2]],
-            y_array[query_voxel[0]][query_voxel[2]],
-            z_array[query_voxel[0]][query_voxel[1]],
-        )
-
-        if is_buried(occluded_dimensions):
-            buried_voxels[0].append(query_voxel[0])
-            buried_voxels[1].append(query_voxel[1])
-            buried_voxels[2].append(query_voxel[2])
-        else:
-            exposed_voxels[0].append(query_voxel[0])
-            exposed_voxels[1].append(query_voxel[1])
-            exposed_voxels[2].append(query_voxel[2])
-
-    buried_voxel_indices = compute_voxel_indices(buried_voxels, voxel_grid_dimensions)
-    exposed_voxel_indices = compute_voxel_indices(exposed_voxels, voxel_grid_dimensions)
+    buried_voxel_indices = solvent_voxels.indices[buried]
+    exposed_voxel_indices = solvent_voxels.indices[~buried]
 
     return (
         VoxelGroup(
-            voxels=(np.array(exposed_voxels[0]), np.array(exposed_voxels[1]), np.array(exposed_voxels[2])),
+            voxels=exposed_voxels,
             indices=exposed_voxel_indices,
             num_voxels=len(exposed_voxel_indices),
             voxel_type="exposed",
             volume=compute_voxel_group_volume(len(exposed_voxel_indices)),
         ),
         VoxelGroup(
-            voxels=(np.array(buried_voxels[0]), np.array(buried_voxels[1]), np.array(buried_voxels[2])),
+            voxels=buried_voxels,
             indices=buried_voxel_indices,
             num_voxels=len(buried_voxel_indices),
             voxel_type="buried",
@@ -215,86 +299,42 @@ def get_exposed_and_buried_voxels(
     )
 
 
-def get_neighbor_voxels_python(
-    query_voxels: tuple[np.ndarray, np.ndarray, np.ndarray], reference_voxels: tuple[np.ndarray, np.ndarray, np.ndarray]
-) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+def get_neighbor_voxels(query_voxels: np.ndarray, reference_voxels: np.ndarray) -> np.ndarray:
     """
     Return the voxels from a query group that neighbor a reference group.
     """
-    neighbor_indices = []
-    for query_index in range(len(query_voxels[0])):
-        query_voxel = get_single_voxel(query_voxels, query_index)
-        for reference_index in range(len(reference_voxels[0])):
-            reference_voxel = get_single_voxel(reference_voxels, reference_index)
-            if is_neighbor_voxel(query_voxel, reference_voxel):
-                neighbor_indices.append(query_index)
-                break
+    if len(query_voxels) == 0 or len(reference_voxels) == 0:
+        return query_voxels[:0]
 
-    return (
-        np.array([query_voxels[0][i] for i in neighbor_indices]),
-        np.array([query_voxels[1][i] for i in neighbor_indices]),
-        np.array([query_voxels[2][i] for i in neighbor_indices]),
-    )
+    # index both groups within a bounding box padded by one voxel so that ordinal offsets never wrap around an axis
+    origin = np.minimum(query_voxels.min(axis=0), reference_voxels.min(axis=0)) - 1
+    box_dimensions = np.maximum(query_voxels.max(axis=0), reference_voxels.max(axis=0)) - origin + 2
+    query_indices = compute_voxel_indices(query_voxels - origin, box_dimensions)
+    reference_indices = compute_voxel_indices(reference_voxels - origin, box_dimensions)
 
+    ordinal_offsets = [1, box_dimensions[2], box_dimensions[1] * box_dimensions[2]]
+    is_neighbor = np.zeros(len(query_voxels), dtype=bool)
+    for offset in ordinal_offsets:
+        is_neighbor |= np.isin(query_indices + offset, reference_indices)
+        is_neighbor |= np.isin(query_indices - offset, reference_indices)
 
-def get_neighbor_voxels_c(
-    query_voxels: tuple[np.ndarray, np.ndarray, np.ndarray], reference_voxels: tuple[np.ndarray, np.ndarray, np.ndarray]
-) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
-    """
-    Return the voxels from a query group that neighbor a reference group.
-    """
-    # make the voxels compatible with C
-    num_query = len(query_voxels[0])
-    query_x = (ctypes.c_int * num_query)(*query_voxels[0])
-    query_y = (ctypes.c_int * num_query)(*query_voxels[1])
-    query_z = (ctypes.c_int * num_query)(*query_voxels[2])
-
-    num_reference = len(reference_voxels[0])
-    reference_x = (ctypes.c_int * num_reference)(*reference_voxels[0])
-    reference_y = (ctypes.c_int * num_reference)(*reference_voxels[1])
-    reference_z = (ctypes.c_int * num_reference)(*reference_voxels[2])
-
-    # setup return and call the function
-    initial_indices = (ctypes.c_int * num_query)(*([-1] * num_query))
-    VOXEL_C.get_neighbor_voxels.restype = ctypes.POINTER(ctypes.c_int * num_query)
-    first_shell_indices_c = VOXEL_C.get_neighbor_voxels(
-        ctypes.byref(query_x),
-        ctypes.byref(query_y),
-        ctypes.byref(query_z),
-        ctypes.byref(reference_x),
-        ctypes.byref(reference_y),
-        ctypes.byref(reference_z),
-        num_query,
-        num_reference,
-        ctypes.byref(initial_indices),
-    )
-    first_shell_indices = [i for i in first_shell_indices_c.contents if i != -1]
-
-    return (
-        np.array([query_voxels[0][i] for i in first_shell_indices]),
-        np.array([query_voxels[1][i] for i in first_shell_indices]),
-        np.array([query_voxels[2][i] for i in first_shell_indices]),
-    )
+    return query_voxels[is_neighbor]
 
 
 def get_first_shell_exposed_voxels(
     exposed_voxels: VoxelGroup,
     buried_voxels: VoxelGroup,
     voxel_grid: VoxelGrid,
-    performant: bool = utils.using_performant(),
 ) -> VoxelGroup:
     """
     Subset exposed voxels into only those neighboring one or more buried voxels.
     """
-    if performant:
-        first_shell_voxels = get_neighbor_voxels_c(exposed_voxels.voxels, buried_voxels.voxels)
-    else:
-        first_shell_voxels = get_neighbor_voxels_python(exposed_voxels.voxels, buried_voxels.voxels)
+    first_shell_voxels = get_neighbor_voxels(exposed_voxels.voxels, buried_voxels.voxels)
 
     first_shell_indices = compute_voxel_indices(first_shell_voxels, voxel_grid.x_y_z)
 
     return VoxelGroup(
-        voxels=(np.array(first_shell_voxels[0]), np.array(first_shell_voxels[1]), np.array(first_shell_voxels[2])),
+        voxels=first_shell_voxels,
         indices=first_shell_indices,
         num_voxels=len(first_shell_indices),
         voxel_type="exposed",
@@ -302,47 +342,26 @@ def get_first_shell_exposed_voxels(
     )
 
 
-def is_neighbor_voxel(voxel_one: tuple[np.int64, ...], voxel_two: tuple[np.int64, ...]) -> bool:
-    """
-    Given two voxels return True if they are ordinal neighbors.
-    """
-    # below approach is ~2x faster than using a list comprehension, presumably because of early exit
-    sum_differences = 0
-    for dimension in range(3):
-        difference = abs(voxel_one[dimension] - voxel_two[dimension])
-
-        if difference > 1:
-            return False
-
-        sum_differences += difference
-
-    # a voxel is an ordinal neighbor when the sum of the absolute differences in axes indices is 1
-    if sum_differences == 1:
-        return True
-
-    return False
-
-
-def get_single_voxel(voxels: tuple[np.ndarray, ...], index: int) -> tuple[np.int64, ...]:
+def compute_voxel_indices(voxels: np.ndarray, grid_dimensions: np.ndarray) -> np.ndarray:
     """
-    Given a set of voxels return just one voxel at index.
+    Given a 3D array of voxels, compute the 1D array of their indices.
     """
     return (
-        voxels[0][index],
-        voxels[1][index],
-        voxels[2][index],
+        voxels[:, 0].astype(np.int64) * (grid_dimensions[1] * grid_dimensions[2])
+        + voxels[:, 1].astype(np.int64) * grid_dimensions[2]
+        + voxels[:, 2].astype(np.int64)
     )
 
 
-def compute_voxel_indices(voxels: tuple[np.ndarray, ...], grid_dimensions: np.ndarray) -> set[int]:
+def unravel_voxel_indices(voxel_indices: np.ndarray, grid_dimensions: np.ndarray) -> np.ndarray:
     """
-    Given a 3D array of voxels, compute the 1D set of their indices.
+    Given a 1D array of voxel indices, compute the (N, 3) array of their voxels.
     """
-    # TODO: is this built-in easier and correct?: x, y, z = np.unravel_index(voxel, self.x_y_z)
-    return {
-        (voxels[0][i] * grid_dimensions[1] * grid_dimensions[2] + voxels[1][i] * grid_dimensions[2] + voxels[2][i])
-        for i in range(len(voxels[0]))
-    }
+    voxels = np.empty((len(voxel_indices), 3), dtype=np.int32)
+    for dimension, coordinates in enumerate(np.unravel_index(voxel_indices, grid_dimensions)):
+        voxels[:, dimension] = coordinates
+
+    return voxels
 
 
 def compute_voxel_group_volume(num_voxels: int) -> float:
@@ -352,66 +371,83 @@ def compute_voxel_group_volume(num_voxels: int) -> float:
     return num_voxels * utils.VOXEL_VOLUME
 
 
-def breadth_first_search_python(voxels: tuple[np.ndarray, ...], searchable_indices: set[int]) -> set[int]:
+def breadth_first_search_python(voxels: np.ndarray, searchable_indices: np.ndarray) -> np.ndarray:
     """
     Given a set of voxels and list of possible indices to add,
     add indices for all ordinal neighbors iteratively until no more such neighbors exist.
-    """
-    searchable_indices = deepcopy(searchable_indices)
-    start_index = searchable_indices.pop()
-    queue_indices = set([start_index])
-    neighbor_indices = set([start_index])
-
-    while len(queue_indices) > 0:
-        current_index = queue_indices.pop()
-        current_voxel = get_single_voxel(voxels, current_index)
-        for searched_index in searchable_indices:
-            searched_voxel = get_single_voxel(voxels, searched_index)
-            if is_neighbor_voxel(current_voxel, searched_voxel):
-                queue_indices.add(searched_index)
-                neighbor_indices.add(searched_index)
-        searchable_indices -= neighbor_indices
-
-    return neighbor_indices
-
-
-def breadth_first_search_c(voxels: tuple[np.ndarray, ...], searchable_indices: set[int]) -> set[int]:
+    The search starts from the first searchable index and returns the sorted indices found.
+    """
+    # hash the searchable voxels by coordinate so that each ordinal neighbor is a constant time lookup
+    searchable_indices = np.asarray(searchable_indices, dtype=np.int64)
+    remaining_voxels = dict(zip(map(tuple, voxels[searchable_indices].tolist()), searchable_indices.tolist()))
+    start_index = int(searchable_indices[0])
+    start_voxel = tuple(voxels[start_index].tolist())
+    del remaining_voxels[start_voxel]
+    queue_voxels = deque([start_voxel])
+    neighbor_indices = [start_index]
+
+    while len(queue_voxels) > 0:
+        x, y, z = queue_voxels.popleft()
+        for neighbor_voxel in (
+            (x - 1, y, z),
+            (x + 1, y, z),
+            (x, y - 1, z),
+            (x, y + 1, z),
+            (x, y, z - 1),
+            (x, y, z + 1),
+        ):
+            neighbor_index = remaining_voxels.pop(neighbor_voxel, None)
+            if neighbor_index is not None:
+                queue_voxels.append(neighbor_voxel)
+                neighbor_indices.append(neighbor_index)
+
+    return np.sort(np.array(neighbor_indices, dtype=np.int64))
+
+
+def breadth_first_search_c(voxels: np.ndarray, searchable_indices: np.ndarray) -> np.ndarray:
     """
     Given a set of voxels and list of possible indices to add,
     add indices for all ordinal neighbors iteratively until no more such neighbors exist.
+    The search starts from the first searchable index and returns the sorted indices found.
     """
-    c_searchable_indices = list(deepcopy(searchable_indices))
+    searchable_indices = np.asarray(searchable_indices, dtype=np.int64)
+    searchable_voxels = voxels[searchable_indices]
 
-    # make the voxels compatible with C
-    num_voxels = len(voxels[0])
-    voxels_x = (ctypes.c_int * num_voxels)(*voxels[0])
-    voxels_y = (ctypes.c_int * num_voxels)(*voxels[1])
-    voxels_z = (ctypes.c_int * num_voxels)(*voxels[2])
+    # flatten within a bounding box padded by one voxel so that ordinal offsets never wrap around an axis
+    origin = searchable_voxels.min(axis=0) - 1
+    box_dimensions = searchable_voxels.max(axis=0) - origin + 2
+    flat_indices = compute_voxel_indices(searchable_voxels - origin, box_dimensions)
+    flat_order = np.argsort(flat_indices)
+    sorted_flat_indices = np.ascontiguousarray(flat_indices[flat_order], dtype=np.int64)
+    start_position = int(np.flatnonzero(flat_order == 0)[0])
 
-    # generate other inputs needed for C function
-    c_searchable_indices = (ctypes.c_int * len(c_searchable_indices))(*c_searchable_indices)
-    initial_indices = (ctypes.c_int * num_voxels)(*([-1] * num_voxels))
+    visited = np.zeros(len(sorted_flat_indices), dtype=np.uint8)
+    neighbor_positions = np.zeros(len(sorted_flat_indices), dtype=np.int32)
 
     # run the breadth-first search
-    VOXEL_C.breadth_first_search.restype = ctypes.POINTER(ctypes.c_int * num_voxels)
-    neighbor_indices_c = VOXEL_C.breadth_first_search(
-        ctypes.byref(voxels_x),
-        ctypes.byref(voxels_y),
-        ctypes.byref(voxels_z),
-        ctypes.byref(c_searchable_indices),
-        len(searchable_indices),
-        ctypes.byref(initial_indices),
+    VOXEL_C.breadth_first_search.restype = ctypes.c_int
+    num_neighbors = VOXEL_C.breadth_first_search(
+        sorted_flat_indices.ctypes.data_as(ctypes.POINTER(ctypes.c_longlong)),
+        len(sorted_flat_indices),
+        start_position,
+        ctypes.c_longlong(int(box_dimensions[1]) * int(box_dimensions[2])),
+        ctypes.c_longlong(int(box_dimensions[2])),
+        visited.ctypes.data_as(ctypes.POINTER(ctypes.c_ubyte)),
+        neighbor_positions.ctypes.data_as(ctypes.POINTER(ctypes.c_int)),
     )
 
-    return set([i for i in neighbor_indices_c.contents if i != -1])
+    return np.sort(searchable_indices[flat_order[neighbor_positions[:num_neighbors]]])
 
 
 def breadth_first_search(
-    voxels: tuple[np.ndarray, ...], searchable_indices: set[int], performant: bool = utils.using_performant()
-) -> set[int]:
+    voxels: np.ndarray, searchable_indices: np.ndarray, performant: bool = utils.using_performant()
+) -> np.ndarray:
     """
     Given a set of voxels and list of possible indices to add,
     add indices for all ordinal neighbors iteratively until no more such neighbors exist.
+
+    The annotation pipeline agglomerates voxels with `get_connected_components` instead,
+    the searches are kept for scripts/profiling/performance_profile.py.
     """
     if performant:
         return breadth_first_search_c(voxels, searchable_indices)
@@ -420,148 +456,180 @@ def breadth_first_search(
 
 
 def get_agglomerated_type(
-    query_indices: set[int], buried_voxels: tuple[np.ndarray, ...], exposed_voxels: tuple[np.ndarray, ...]
-) -> tuple[set[int], str]:
+    query_indices: np.ndarray, buried_voxels: np.ndarray, exposed_neighbor_mask: np.ndarray
+) -> tuple[np.ndarray, str]:
     """
     Find "surface" voxels, being buried voxel in direct contact with an exposed voxel. Four possibilites:
 
     a) there are no "surface" voxels -> this is a cavity
-    b) all "surface" voxels can be agglomerated (BFS) into a single group -> this is a pocket
-    c) the "surface" voxels can be agglomerated (BFS) into exactly two groups -> this is a pore
-    d) the "surface" voxels cannot be agglomerated (BFS) into less than 3 groups -> this is a hub
-    """
-    direct_surface_indices = set()
-    for query_index in query_indices:
-        query_voxel = get_single_voxel(buried_voxels, query_index)
-        for exposed_voxel_index in range(len(exposed_voxels[0])):
-            exposed_voxel = get_single_voxel(exposed_voxels, exposed_voxel_index)
-            if is_neighbor_voxel(query_voxel, exposed_voxel):
-                direct_surface_indices.add(query_index)
-                break
+    b) all "surface" voxels can be agglomerated into a single group -> this is a pocket
+    c) the "surface" voxels can be agglomerated into exactly two groups -> this is a pore
+    d) the "surface" voxels cannot be agglomerated into less than 3 groups -> this is a hub
+
+    `exposed_neighbor_mask` marks every voxel of the grid that is an exposed voxel or neighbors one.
+    """
+    query_voxels = buried_voxels[query_indices]
+    direct_surface = exposed_neighbor_mask[tuple(query_voxels.T)]
 
     # if there are no surface contacts, this must be a cavity
-    if len(direct_surface_indices) == 0:
-        return direct_surface_indices, "cavity"
+    if not direct_surface.any():
+        return np.array([], dtype=np.int64), "cavity"
+
+    # work within the bounding box of the query voxels
+    local_voxels = query_voxels - query_voxels.min(axis=0)
+    query_mask = np.zeros(local_voxels.max(axis=0) + 1, dtype=bool)
+    query_mask[tuple(local_voxels.T)] = True
+    direct_surface_mask = np.zeros_like(query_mask)
+    direct_surface_mask[tuple(local_voxels[direct_surface].T)] = True
 
     # add all voxels that are neighbours to the direct surface voxels
-    neighbor_surface_indices = set()
-    for query_index in query_indices - direct_surface_indices:
-        query_voxel = get_single_voxel(buried_voxels, query_index)
-        for surface_index in direct_surface_indices:
-            surface_voxel = get_single_voxel(buried_voxels, surface_index)
-            if is_neighbor_voxel(surface_voxel, query_voxel):
-                neighbor_surface_indices.add(query_index)
-                break
-
-    # we pass all surface indices and the buried voxels for BFS
-    # If there is more than one distinct surface (e.g. a pore) then
-    #   BFS will terminate after agglomerating just one of the surfaces
-    #   and `single_surface_indices` will be less than `surface_indices`
     # NOTE: we have to union the direct and neighbor surfaces, otherwise small discritization
     #   on the surface would look like a distinct surface
-    surface_indices = direct_surface_indices.union(neighbor_surface_indices)
-    single_surface_indices = breadth_first_search(buried_voxels, surface_indices)
-    if len(single_surface_indices) < len(surface_indices):
-        # run the agglomeration one more time on what's left
-        remaining_surface_indices = surface_indices - single_surface_indices
-        single_surface_indices = breadth_first_search(buried_voxels, remaining_surface_indices)
+    surface_mask = dilate_ordinal(direct_surface_mask) & query_mask
+    surface_indices = query_indices[surface_mask[tuple(local_voxels.T)]]
+
+    # each distinct surface agglomerates into its own group
+    _, num_surfaces = ndimage.label(surface_mask, structure=ORDINAL_STRUCTURE)
+    if num_surfaces > 2:
+        return surface_indices, "hub"
+    elif num_surfaces == 2:
+        return surface_indices, "pore"
+
+    return surface_indices, "pocket"
+
 
-        # if there are stil indices left, there were more than 2 surfaces, hence a hub
-        if len(single_surface_indices) < len(remaining_surface_indices):
-            return direct_surface_indices.union(neighbor_surface_indices), "hub"
+def get_exposed_neighbor_mask(exposed_voxels: np.ndarray, voxel_grid_dimensions: np.ndarray) -> np.ndarray:
+    """
+    Generate a mask over the voxel grid that is True for exposed voxels and their ordinal neighbors.
+    """
+    exposed_mask = np.zeros(voxel_grid_dimensions, dtype=bool)
+    exposed_mask[tuple(exposed_voxels.T)] = True
+
+    return dilate_ordinal(exposed_mask)
+
+
+def dilate_ordinal(mask: np.ndarray) -> np.ndarray:
+    """
+    Dilate a 3D boolean mask by one voxel along each ordinal direction.
+    Equivalent to `ndimage.binary_dilation` with `ORDINAL_STRUCTURE`.
+
+    The mask is packed into bits along z, so the x and y shifts OR eight voxels at a time
+    and the z shifts carry a single bit between neighboring bytes.
+    """
+    words = np.packbits(mask, axis=2, bitorder="little")
+    dilated = words.copy()
 
-        # othewise, exactly 2 and a pore
-        return direct_surface_indices.union(neighbor_surface_indices), "pore"
+    dilated[1:] |= words[:-1]
+    dilated[:-1] |= words[1:]
+    dilated[:, 1:] |= words[:, :-1]
+    dilated[:, :-1] |= words[:, 1:]
+    dilated |= words << 1
+    dilated[:, :, 1:] |= words[:, :, :-1] >> 7
+    dilated |= words >> 1
+    dilated[:, :, :-1] |= words[:, :, 1:] << 7
 
-    # if the first BFS went to completion and consumed all surfaces, there was only a single surface, hence pocket
-    return direct_surface_indices.union(neighbor_surface_indices), "pocket"
+    # bits past the end of the z axis are dropped when unpacking
+    return np.unpackbits(dilated, axis=2, count=mask.shape[2], bitorder="little").view(bool)
 
 
-def get_voxel_group_center(voxel_indices: set[int], voxel_grid: VoxelGrid) -> np.ndarray:
+def get_connected_components(voxels: np.ndarray, voxel_grid_dimensions: np.ndarray) -> list[np.ndarray]:
+    """
+    Agglomerate voxels into groups of ordinal neighbors.
+    Returns the indices into `voxels` of each group.
+    """
+    voxel_mask = np.zeros(voxel_grid_dimensions, dtype=bool)
+    voxel_mask[tuple(voxels.T)] = True
+    labels, _ = ndimage.label(voxel_mask, structure=ORDINAL_STRUCTURE)
+
+    # group the voxel indices by label, every voxel is labelled so label 0 (background) is always empty
+    voxel_labels = labels[tuple(voxels.T)]
+    label_counts = np.bincount(voxel_labels)
+    return np.split(np.argsort(voxel_labels, kind="stable"), np.cumsum(label_counts)[:-1])[1:]
+
+
+def get_voxel_group_center(voxel_indices: np.ndarray, voxel_grid: VoxelGrid) -> np.ndarray:
     """
     Compute the center of geometry for the voxel group.
     """
-    voxel_coords = np.array([voxel_grid.voxel_centers[voxel_index] for voxel_index in voxel_indices])
+    voxel_coords = utils.get_voxel_centers(voxel_indices, voxel_grid)
     return np.mean(voxel_coords, axis=0)
 
 
-def get_voxel_group_axial_lengths(voxel_indices: set[int], voxel_grid: VoxelGrid) -> list[float]:
+def get_voxel_group_axial_lengths(voxel_indices: np.ndarray, voxel_grid: VoxelGrid) -> list[float]:
     """
     Align the voxel group to it's principal axes, then compute the maximum length along each axis.
     """
-    voxel_coords = np.array([voxel_grid.voxel_centers[voxel_index] for voxel_index in voxel_indices])
+    # sort the indices so that the result does not depend on the order the voxels are given in
+    voxel_coords = utils.get_voxel_centers(np.sort(voxel_indices), voxel_grid)
 
-    rotation, translation = align.get_principal_axis_alignment_translation_rotation(voxel_coords)
+    return align.get_principal_axis_lengths(voxel_coords)
 
-    # apply the rotation and translation
-    voxel_coords = align.rotate_and_translate_coords(voxel_coords, rotation, translation)
 
-    # compute the maximum length across each axis
-    xs = [voxel_coord[0] for voxel_coord in voxel_coords]
-    ys = [voxel_coord[1] for voxel_coord in voxel_coords]
-    zs = [voxel_coord[2] for voxel_coord in voxel_coords]
+def get_agglomerated_voxel_group(
+    agglomerable_indices: np.ndarray,
+    buried_voxels: VoxelGroup,
+    exposed_neighbor_mask: np.ndarray,
+    voxel_grid: VoxelGrid,
+) -> VoxelGroup:
+    """
+    Build the VoxelGroup of a single connected component of buried voxels, including its type.
+    """
+    # if too small, don't assign direct surface indices and assign type "occluded"
+    if len(agglomerable_indices) <= MIN_NUM_VOXELS:
+        direct_surface_indices = np.array([], dtype=np.int64)
+        agglomerated_type = "occluded"
+    else:
+        # identify what these agglomerated voxels are
+        direct_surface_indices, agglomerated_type = get_agglomerated_type(
+            agglomerable_indices, buried_voxels.voxels, exposed_neighbor_mask
+        )
 
-    return sorted([max(xs) - min(xs), max(ys) - min(ys), max(zs) - min(zs)], reverse=True)
+    # get the voxels and their voxel-grid indices
+    volume_voxels = buried_voxels.voxels[agglomerable_indices]
+    volume_indices = buried_voxels.indices[agglomerable_indices]
+    # create the voxelgroup
+    return VoxelGroup(
+        voxels=volume_voxels,
+        indices=volume_indices,
+        surface_indices=buried_voxels.indices[direct_surface_indices],
+        num_voxels=len(volume_indices),
+        voxel_type=agglomerated_type,
+        volume=compute_voxel_group_volume(len(volume_indices)),
+        center=get_voxel_group_center(volume_indices, voxel_grid),
+        axial_lengths=get_voxel_group_axial_lengths(volume_indices, voxel_grid),
+    )
 
 
 def get_pores_pockets_cavities_occluded(
-    buried_voxels: VoxelGroup, exposed_voxels: VoxelGroup, voxel_grid: VoxelGrid
+    buried_voxels: VoxelGroup, exposed_voxels: VoxelGroup, voxel_grid: VoxelGrid, jobs: int = 1
 ) -> tuple[
     dict[int, VoxelGroup], dict[int, VoxelGroup], dict[int, VoxelGroup], dict[int, VoxelGroup], dict[int, VoxelGroup]
 ]:
     """
     Agglomerate buried solvent voxels into hubs, pores, pockets, cavities, and simply occluded.
+
+    Each connected component is typed independently, with `jobs` > 1 they are spread over a thread pool.
     """
-    buried_indices = set(range(buried_voxels.voxels[0].size))
-    agglomerated_indices = set()
+    exposed_neighbor_mask = get_exposed_neighbor_mask(exposed_voxels.voxels, voxel_grid.x_y_z)
+    components = get_connected_components(buried_voxels.voxels, voxel_grid.x_y_z)
+
+    agglomerate = partial(
+        get_agglomerated_voxel_group,
+        buried_voxels=buried_voxels,
+        exposed_neighbor_mask=exposed_neighbor_mask,
+        voxel_grid=voxel_grid,
+    )
+    if jobs > 1:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            voxel_groups = list(executor.map(agglomerate, components))
+    else:
+        voxel_groups = list(map(agglomerate, components))
 
     hubs, pores, pockets, cavities, occluded = {}, {}, {}, {}, {}
     hub_id, pore_id, pocket_id, cavity_id, occluded_id = 0, 0, 0, 0, 0
 
-    while len(agglomerated_indices) < len(buried_indices):
-        remaining_indices = buried_indices - agglomerated_indices
-
-        # perform BFS over the remaining indices
-        agglomerable_indices = breadth_first_search(buried_voxels.voxels, remaining_indices)
-        # iterate our counter of finished indices
-        agglomerated_indices = agglomerated_indices.union(agglomerable_indices)
-
-        # if too small, don't assign direct surface indices and assign type "occluded"
-        if len(agglomerable_indices) <= MIN_NUM_VOXELS:
-            direct_surface_indices = set()
-            agglomerated_type = "occluded"
-        else:
-            # identify what these agglomerated voxels are
-            direct_surface_indices, agglomerated_type = get_agglomerated_type(
-                agglomerable_indices, buried_voxels.voxels, exposed_voxels.voxels
-            )
-
-        # get the surface voxels for use in getting their voxel-grid indices
-        surface_voxels = (
-            np.array([buried_voxels.voxels[0][index] for index in direct_surface_indices]),
-            np.array([buried_voxels.voxels[1][index] for index in direct_surface_indices]),
-            np.array([buried_voxels.voxels[2][index] for index in direct_surface_indices]),
-        )
-
-        # get the voxels
-        volume_voxels = (
-            np.array([buried_voxels.voxels[0][index] for index in agglomerable_indices]),
-            np.array([buried_voxels.voxels[1][index] for index in agglomerable_indices]),
-            np.array([buried_voxels.voxels[2][index] for index in agglomerable_indices]),
-        )
-        # get the voxel indices
-        volume_indices = compute_voxel_indices(volume_voxels, voxel_grid.x_y_z)
-        # create the voxelgroup
-        voxel_group = VoxelGroup(
-            voxels=volume_voxels,
-            indices=volume_indices,
-            surface_indices=compute_voxel_indices(surface_voxels, voxel_grid.x_y_z),
-            num_voxels=len(volume_indices),
-            voxel_type=agglomerated_type,
-            volume=compute_voxel_group_volume(len(volume_indices)),
-            center=get_voxel_group_center(volume_indices, voxel_grid),
-            axial_lengths=get_voxel_group_axial_lengths(volume_indices, voxel_grid),
-        )
+    for voxel_group in voxel_groups:
+        agglomerated_type = voxel_group.voxel_type
 
         # add the voxelgroup depending on type and increment the type counter
         if agglomerated_type == "hub":
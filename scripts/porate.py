@@ -3,16 +3,19 @@ Command-line entry-point to find pores and cavities in PDBs.
 """
 
 from pathlib import Path
+import os
+from itertools import islice
+from typing import Callable, Iterable
+from concurrent.futures import Executor, ProcessPoolExecutor, FIRST_COMPLETED, wait
 
 import typer
-import multiprocessing
 
-from pore import pore, cli, utils, pdb
+from pore import pore, cli, utils, pdb, voxel
 from pore.constants import VOXEL_SIZE
 from pore.paths import ANNOTATED_DF_DIR, ANNOTATED_PDB_DIR
 
 
-def porate_pdb_id(pdb_id: str) -> None:
+def porate_pdb_id(pdb_id: str, jobs: int = 1) -> None:
     """
     Download the given PDB ID and then porate it.
     """
@@ -22,7 +25,7 @@ def porate_pdb_id(pdb_id: str) -> None:
             return None
 
         print(f"Working on: {pdb_id}")
-        annotation, annotated_pdb_lines = pore.process_pdb_file(pdb_path)
+        annotation, annotated_pdb_lines = pore.process_pdb_file(pdb_path, jobs=jobs)
         annotation_df = utils.make_annotation_dataframe(annotation)
 
         utils.save_annotation_dataframe(pdb_id, annotation_df)
@@ -33,13 +36,13 @@ def porate_pdb_id(pdb_id: str) -> None:
         print(annotation_df)
 
 
-def porate_pdb_file(pdb_file: Path) -> None:
+def porate_pdb_file(pdb_file: Path, jobs: int = 1) -> None:
     """
     Operate directly on the given PDB file.
     """
     if not utils.have_annotation(pdb_file.stem):
         print(f"Working on: {pdb_file.stem}")
-        annotation, annotated_pdb_lines = pore.process_pdb_file(pdb_file)
+        annotation, annotated_pdb_lines = pore.process_pdb_file(pdb_file, jobs=jobs)
         annotation_df = utils.make_annotation_dataframe(annotation)
 
         utils.save_annotation_dataframe(Path(pdb_file).stem, annotation_df)
@@ -50,13 +53,43 @@ def porate_pdb_file(pdb_file: Path) -> None:
         print(annotation_df)
 
 
+def init_worker() -> None:
+    """
+    Keep each worker process to a single OpenMP thread, the pool already spreads the work across cores.
+    """
+    os.environ["OMP_NUM_THREADS"] = "1"
+    # a forked worker inherits an already initialized OpenMP runtime, so limit it directly as well
+    voxel.set_c_threads(1)
+
+
+def get_chunksize(num_tasks: int, jobs: int) -> int:
+    """
+    Hand each worker about four batches of tasks, so that large structures still balance across workers.
+    """
+    return max(1, num_tasks // (jobs * 4))
+
+
+def map_bounded(executor: Executor, function: Callable, items: Iterable, window: int) -> None:
+    """
+    Run the function over the items on the executor, keeping at most `window` tasks in flight.
+    Items are only pulled from the iterable as earlier tasks complete.
+    """
+    items = iter(items)
+    in_flight = {executor.submit(function, item) for item in islice(items, window)}
+    while in_flight:
+        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            future.result()
+        in_flight.update(executor.submit(function, item) for item in islice(items, len(done)))
+
+
 def main(
     porate_input: str = typer.Argument(
         ..., help="PDB ID, PDB file, file with one PDB ID per line, or folder containing PDB files"
     ),
     resolution: float = typer.Option(VOXEL_SIZE, help="Edge-length of voxels used to discretize the structure."),
     non_protein: bool = typer.Option(False, help="Include non-protein residues during the calculations."),
-    jobs: int = typer.Option(1, help="Number of threads to use."),
+    jobs: int = typer.Option(1, help="Number of worker processes, or of threads when porating a single structure."),
 ):
     """
     Find pores and cavities in the supplied PDB files.
@@ -70,21 +103,24 @@ def main(
     input_type = cli.guess_input_type(porate_input)
 
     if input_type == "pdb_id":
-        porate_pdb_id(porate_input)
+        porate_pdb_id(porate_input, jobs=jobs)
     elif input_type == "pdb_file":
         pdb_file = Path(porate_input)
-        porate_pdb_file(pdb_file)
+        porate_pdb_file(pdb_file, jobs=jobs)
     elif input_type == "id_file":
+        # stream the IDs from the file, only a few tasks per worker are queued at any time
+        # already annotated IDs are skipped here so they never cost a task in the pool
         with open(porate_input, mode="r", encoding="utf-8") as id_file:
-            pdb_ids = [line.strip() for line in id_file.readlines()]
-        tasks = [[pdb_id] for pdb_id in pdb_ids]
-        with multiprocessing.Pool(processes=jobs) as pool:
-            pool.starmap(porate_pdb_id, tasks)
+            pdb_ids = (line.strip() for line in id_file)
+            pending_pdb_ids = (pdb_id for pdb_id in pdb_ids if not utils.have_annotation(pdb_id))
+            with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker) as executor:
+                map_bounded(executor, porate_pdb_id, pending_pdb_ids, window=jobs * 4)
     elif input_type == "pdb_dir":
-        pdb_files = Path(porate_input).glob("*.pdb")
-        tasks = [[pdb_file] for pdb_file in pdb_files]
-        with multiprocessing.Pool(processes=jobs) as pool:
-            pool.starmap(porate_pdb_file, tasks)
+        pdb_files = [
+            pdb_file for pdb_file in Path(porate_input).glob("*.pdb") if not utils.have_annotation(pdb_file.stem)
+        ]
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker) as executor:
+            list(executor.map(porate_pdb_file, pdb_files, chunksize=get_chunksize(len(pdb_files), jobs)))
     else:
         raise RuntimeError("File mode not implemented")
 
@@ -1,5 +1,6 @@
 import time
 
+import numpy as np
 import typer
 
 from pore import voxel, pdb, fib_sphere, utils, paths
@@ -25,9 +26,7 @@ def main(code: str = "python", pdb_name: str = "pore"):
     end_fib_time = time.time()
 
     start_voxelize_time = time.time()
-    cloud = voxel.coords_to_point_cloud(coords)
-    cloud, voxel_grid_id = voxel.add_voxel_grid(cloud)
-    voxel_grid = voxel.get_voxel_grid(cloud, voxel_grid_id)
+    voxel_grid = voxel.voxelize_coords(coords, utils.VOXEL_SIZE)
     end_voxelize_time = time.time()
 
     start_solvent_time = time.time()
@@ -37,11 +36,11 @@ def main(code: str = "python", pdb_name: str = "pore"):
     end_solvent_time = time.time()
 
     start_bfs_time = time.time()
-    buried_indices = set(range(buried_voxels.voxels[0].size))
-    agglomerated_indices = set()
+    buried_indices = np.arange(len(buried_voxels.voxels), dtype=np.int64)
+    agglomerated_indices = np.array([], dtype=np.int64)
     # do BFS until we've agglomerated all indices into neighbour groups
     while len(agglomerated_indices) < len(buried_indices):
-        remaining_indices = buried_indices - agglomerated_indices
+        remaining_indices = np.setdiff1d(buried_indices, agglomerated_indices, assume_unique=True)
 
         # perform BFS over the remaining indices
         if code == "python":
@@ -52,7 +51,7 @@ def main(code: str = "python", pdb_name: str = "pore"):
             raise RuntimeError("Language not implemented")
 
         # iterate our counter of finished indices
-        agglomerated_indices = agglomerated_indices.union(agglomerable_indices)
+        agglomerated_indices = np.concatenate([agglomerated_indices, agglomerable_indices])
     end_bfs_time = time.time()
 
     load_time = end_load_time - start_load_time
@@ -4,5 +4,8 @@ fi
 if test -f "source/fib_sphere.so"; then
     rm source/fib_sphere.so
 fi
-cc -fPIC -shared -o source/voxel.so source/voxel.c
+if ! cc -fPIC -shared -fopenmp -o source/voxel.so source/voxel.c 2> /dev/null; then
+    echo "OpenMP not available, building voxel.so single-threaded"
+    cc -fPIC -shared -o source/voxel.so source/voxel.c
+fi
 cc -fPIC -shared -o source/fib_sphere.so source/fib_sphere.c
\ No newline at end of file
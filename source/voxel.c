@@ -3,106 +3,78 @@
 
 #include <stdlib.h>
 #include <stdio.h>
-
-
-int *get_single_voxel(int* voxels_x, int* voxels_y, int* voxels_z, int index, int* voxel_indices) {
-    voxel_indices[0] = voxels_x[index];
-    voxel_indices[1] = voxels_y[index];
-    voxel_indices[2] = voxels_z[index];
-
-    return voxel_indices;
-}
-
-
-int is_neighbor_voxel(int* voxel_one, int* voxel_two) {
-    int sum_differences = 0;
-    for (int i = 0; i < 3; i++) {
-        int difference = abs(voxel_one[i] - voxel_two[i]);
-
-        if (difference > 1) {
-            return 0;
-        }
-
-        sum_differences += difference;
-    }
-
-    if (sum_differences == 1) {
-        return 1;
-    }
-
-    return 0;
-}
-
-
-int count_positive_ints(int values[]) {
-    int num_positive = 0;
-    for (int i = 0; i < (sizeof(*values) / sizeof(int)); i++) {
-        if (values[i] >= 0) {
-            num_positive += 1;
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+
+int find_flat_index(long long* sorted_flat_indices, int num_indices, long long flat_index) {
+    // binary search for the position of `flat_index`, -1 if it is not present
+    int low = 0, high = num_indices - 1;
+    while (low <= high) {
+        int middle = low + (high - low) / 2;
+        if (sorted_flat_indices[middle] < flat_index) {
+            low = middle + 1;
+        } else if (sorted_flat_indices[middle] > flat_index) {
+            high = middle - 1;
+        } else {
+            return middle;
         }
     }
 
-    return num_positive;
+    return -1;
 }
 
 
-int *breadth_first_search(int* voxels_x, int* voxels_y, int* voxels_z, int* input_searchable_indices, int num_searchable_indices, int* neighbor_indices) {
-    // initialize arrays to hold return values for `get_single_voxel`
-    int current_voxel_indices[3];
-    int searched_voxel_indices[3];
+int breadth_first_search(long long* sorted_flat_indices, int num_indices, int start_position, long long stride_x, long long stride_y, unsigned char* visited, int* neighbor_positions) {
+    // `neighbor_positions` doubles as the FIFO queue: everything behind `head` has been expanded
+    // each voxel is expanded once with six binary-search probes, so the search is O(N log N)
+    long long offsets[6] = {-stride_x, stride_x, -stride_y, stride_y, -1, 1};
+    int head = 0, tail = 0;
 
-    // initialize and set values for a copy of searchable indices and a queue
-    int searchable_indices[num_searchable_indices];
-    int queue_indices[num_searchable_indices];
-    for (int i = 0; i < num_searchable_indices; i++) {
-        searchable_indices[i] = input_searchable_indices[i];
-        queue_indices[i] = -1;
-    }
+    visited[start_position] = 1;
+    neighbor_positions[tail++] = start_position;
 
-    // initialize a queue and stack
-    int queue_position = 0, indices_position = 0;
-    queue_indices[queue_position] = searchable_indices[indices_position];
-    neighbor_indices[indices_position] = searchable_indices[indices_position];
-    indices_position++;
-
-    while (count_positive_ints(queue_indices) > 0) {
-        int current_index = queue_indices[queue_position];
-        queue_indices[queue_position] = -1;
-        queue_position--;
-
-        int* current_voxel = get_single_voxel(voxels_x, voxels_y, voxels_z, current_index, current_voxel_indices);
-        for (int i = indices_position; i < num_searchable_indices; i++) {
-            int* searched_voxel = get_single_voxel(voxels_x, voxels_y, voxels_z, searchable_indices[i], searched_voxel_indices);
-            if (is_neighbor_voxel(current_voxel, searched_voxel)) {
-                queue_position++;;
-                queue_indices[queue_position] = searchable_indices[i];
-
-                neighbor_indices[indices_position] = searchable_indices[i];
-                searchable_indices[i] = searchable_indices[indices_position];
-                indices_position++;
+    while (head < tail) {
+        long long current_flat_index = sorted_flat_indices[neighbor_positions[head++]];
+        for (int i = 0; i < 6; i++) {
+            int position = find_flat_index(sorted_flat_indices, num_indices, current_flat_index + offsets[i]);
+            if (position >= 0 && !visited[position]) {
+                visited[position] = 1;
+                neighbor_positions[tail++] = position;
             }
         }
     }
 
-    return neighbor_indices;
+    return tail;
 }
 
 
-int *get_neighbor_voxels(int* query_voxels_x, int* query_voxels_y, int* query_voxels_z, int* reference_voxels_x, int* reference_voxels_y, int* reference_voxels_z, int num_query, int num_reference, int* neighbor_indices) {
-    // initialize arrays to hold return values for `get_single_voxel`
-    int query_voxel_indices[3];
-    int reference_voxel_indices[3];
+void set_num_threads(int num_threads) {
+    // without OpenMP the library is single-threaded and there is nothing to limit
+    #ifdef _OPENMP
+    omp_set_num_threads(num_threads);
+    #endif
+}
 
-    for (int query_index = 0; query_index < num_query; query_index++) {
-        int* query_voxel = get_single_voxel(query_voxels_x, query_voxels_y, query_voxels_z, query_index, query_voxel_indices);
-        for (int reference_index = 0; reference_index < num_reference; reference_index++) {
-            int* reference_voxel = get_single_voxel(reference_voxels_x, reference_voxels_y, reference_voxels_z, reference_index, reference_voxel_indices);
-            if (is_neighbor_voxel(query_voxel, reference_voxel)) {
-                neighbor_indices[query_index] = query_index;
-                break;
-            }
-        }
-    }
 
-    return neighbor_indices;
+void classify_buried_voxels(int* query_voxels_x, int* query_voxels_y, int* query_voxels_z, int num_query, int* min_x, int* max_x, int* min_y, int* max_y, int* min_z, int* max_z, int dimension_x, int dimension_y, int dimension_z, unsigned char* buried_lookup, unsigned char* buried) {
+    // every query voxel is independent, so split them across threads when built with OpenMP
+    #pragma omp parallel for schedule(static)
+    for (int i = 0; i < num_query; i++) {
+        int x = query_voxels_x[i], y = query_voxels_y[i], z = query_voxels_z[i];
+        int x_plane = y * dimension_z + z;
+        int y_plane = x * dimension_z + z;
+        int z_plane = x * dimension_y + y;
+
+        // pack the six occluded dimensions (-x, +x, -y, +y, -z, +z) into the low bits
+        int occluded_dimensions = (min_x[x_plane] < x)
+            | ((max_x[x_plane] > x) << 1)
+            | ((min_y[y_plane] < y) << 2)
+            | ((max_y[y_plane] > y) << 3)
+            | ((min_z[z_plane] < z) << 4)
+            | ((max_z[z_plane] > z) << 5);
+
+        buried[i] = buried_lookup[occluded_dimensions];
+    }
 }